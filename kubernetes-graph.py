@@ -1,12 +1,16 @@
 import argparse
+import json
+import os
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+import ijson
 from kubernetes import client, config
-from graphviz import Digraph
+from graphviz import Source
 import logging
 
 JOB_LABEL = 'job'
 DAEMON_LABEL = 'daemon'
 REPLICA_LABEL = 'replica'
-REPLICA_SET_PREFIX = 'ReplicaSet'
 CRON_JOB_PREFIX = 'CronJob'
 JOB_PREFIX = 'Job'
 INGRESS_PREFIX = 'Ingress'
@@ -15,71 +19,201 @@ POD_PREFIX = 'Pod'
 DAEMON_SET_PREFIX = 'DaemonSet'
 STATEFUL_SET_PREFIX = 'StatefulSet'
 DEPLOYMENT_PREFIX = 'Deployment'
+# resourceVersion "0" lets the apiserver answer lists from its watch cache instead of a quorum read from etcd
+LIST_RESOURCE_VERSION = '0'
+CONNECTION_POOL_MAXSIZE = 16
+PARTIAL_METADATA_ACCEPT = 'application/json;as=PartialObjectMetadataList;g=meta.k8s.io;v=v1'
+
+# Lightweight stand-ins for the swagger models, holding only the fields the graph needs
+PartialObject = namedtuple('PartialObject', 'metadata')
+ObjectMeta = namedtuple('ObjectMeta', 'namespace name uid labels owner_references')
+OwnerReference = namedtuple('OwnerReference', 'kind uid')
+Pod = namedtuple('Pod', 'metadata container_ports')
+Service = namedtuple('Service', 'metadata selector target_ports')
+Ingress = namedtuple('Ingress', 'metadata paths')
+NamespacePods = namedtuple('NamespacePods', 'by_label by_port')
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='[%(asctime)s.%(msecs)03d] [%(levelname)s] %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
 logger = logging.getLogger(__name__)
 
+_loaded = False
+_api_client = None
+
 
 def load_kube_config():
     """
-    Load Kubernetes configuration from the default kubeconfig file.
+    Load Kubernetes configuration from the default kubeconfig file and build the shared ApiClient.
+    Subsequent calls are no-ops.
     """
+    global _loaded, _api_client
+    if _loaded:
+        return
     config.load_kube_config()
+    configuration = client.Configuration.get_default_copy()
+    configuration.connection_pool_maxsize = CONNECTION_POOL_MAXSIZE
+    _api_client = client.ApiClient(configuration)
+    _loaded = True
+
+
+def _quote(value):
+    return '"%s"' % str(value).replace('"', '\\"')
+
+
+class DotGraph:
+    """
+    Minimal DOT writer with the node/edge/render subset of graphviz.Digraph used here.
+    Statements are formatted straight into a list of lines and joined once at render time;
+    repeated nodes and edges are dropped before formatting.
+    """
+
+    def __init__(self, name, format, **graph_attr):
+        self.format = format
+        attrs = ' '.join(f'{k}={_quote(v)}' for k, v in sorted(graph_attr.items()))
+        self.lines = [f'digraph {_quote(name)} {{\n', f'\tgraph [{attrs}]\n']
+        self._nodes = set()
+        self._edges = set()
+
+    def node(self, nid, label, shape, style, fillcolor):
+        if nid in self._nodes:
+            return
+        self._nodes.add(nid)
+        self.lines.append(f'\t{_quote(nid)} [label={_quote(label)} fillcolor={fillcolor} shape={shape} style={style}]\n')
+
+    def edge(self, tail, head, label=None):
+        key = (tail, head, label)
+        if key in self._edges:
+            return
+        self._edges.add(key)
+        attrs = f' [label={_quote(label)}]' if label is not None else ''
+        self.lines.append(f'\t{_quote(tail)} -> {_quote(head)}{attrs}\n')
+
+    @property
+    def source(self):
+        return ''.join(self.lines) + '}\n'
+
+    def render(self, filename):
+        """
+        Pipe the source through Graphviz and write the output to <filename>.<format>, without
+        writing the DOT source to disk.
+        """
+        out = f"{filename}.{self.format}"
+        data = Source(self.source, format=self.format).pipe()
+        os.makedirs(os.path.dirname(out) or '.', exist_ok=True)
+        with open(out, 'wb') as f:
+            f.write(data)
+        return out
 
 
 def create_graph(format='png', dpi=600, size=20):
     """
-    Initialize and return a Graphviz Digraph with layout and size settings.
+    Initialize and return a DOT graph with layout and size settings.
     """
-    dot = Digraph('k8s', format=format)
-    dot.attr(rankdir='LR', size=str(size), dpi=str(dpi))
-    return dot
+    return DotGraph('k8s', format, rankdir='LR', size=size, dpi=dpi)
 
 
 # Fetch functions
 
+def _object_meta(md):
+    owners = tuple(OwnerReference(o['kind'], o['uid']) for o in md.get('ownerReferences') or ())
+    return ObjectMeta(md.get('namespace'), md['name'], md.get('uid'), md.get('labels') or {}, owners)
+
+
+def _partial_object(md):
+    return PartialObject(_object_meta(md))
+
+
+def _pod(item):
+    containers = (item.get('spec') or {}).get('containers') or ()
+    ports = tuple(p['containerPort'] for c in containers for p in c.get('ports') or ())
+    return Pod(_object_meta(item['metadata']), ports)
+
+
+def _service(item):
+    spec = item.get('spec') or {}
+    target_ports = tuple(p.get('targetPort') for p in spec.get('ports') or ())
+    return Service(_object_meta(item['metadata']), spec.get('selector') or {}, target_ports)
+
+
+def _ingress(item):
+    # Flatten rules -> http.paths into (service name, path) pairs; non-service backends have no Service node
+    paths = tuple((p['backend']['service']['name'], p.get('path'))
+                  for rule in (item.get('spec') or {}).get('rules') or ()
+                  for p in (rule.get('http') or {}).get('paths') or ()
+                  if p.get('backend', {}).get('service'))
+    return Ingress(_object_meta(item['metadata']), paths)
+
+
+def list_raw(group_version, plural, ns=None, accept='application/json'):
+    """
+    Issue a list call through the shared ApiClient and return the raw, not yet read HTTP response.
+    """
+    base = '/api/v1' if group_version == 'v1' else f'/apis/{group_version}'
+    path = f"{base}/namespaces/{ns}/{plural}" if ns else f"{base}/{plural}"
+    return _api_client.call_api(path, 'GET', query_params=[('resourceVersion', LIST_RESOURCE_VERSION)],
+                                header_params={'Accept': accept}, auth_settings=['BearerToken'],
+                                _return_http_data_only=True, _preload_content=False)
+
+
+def list_items(group_version, plural, ns=None, accept='application/json'):
+    """
+    List a resource kind and return its items as plain decoded JSON dicts.
+    """
+    resp = list_raw(group_version, plural, ns, accept=accept)
+    try:
+        data = json.loads(resp.data)
+    finally:
+        resp.release_conn()
+    return data.get('items') or ()
+
+
+def list_metadata(group_version, plural, ns=None):
+    """
+    List only the metadata of a resource kind as PartialObjectMetadata, skipping swagger model construction.
+    """
+    items = list_items(group_version, plural, ns, accept=PARTIAL_METADATA_ACCEPT)
+    return [_partial_object(item['metadata']) for item in items]
+
+
 def fetch_deployments(ns=None):
-    api = client.AppsV1Api()
-    return api.list_namespaced_deployment(ns).items if ns else api.list_deployment_for_all_namespaces().items
+    return list_metadata('apps/v1', 'deployments', ns)
 
 
 def fetch_statefulsets(ns=None):
-    api = client.AppsV1Api()
-    return api.list_namespaced_stateful_set(ns).items if ns else api.list_stateful_set_for_all_namespaces().items
+    return list_metadata('apps/v1', 'statefulsets', ns)
 
 
 def fetch_daemonsets(ns=None):
-    api = client.AppsV1Api()
-    return api.list_namespaced_daemon_set(ns).items if ns else api.list_daemon_set_for_all_namespaces().items
+    return list_metadata('apps/v1', 'daemonsets', ns)
+
+
+def fetch_replicasets(ns=None):
+    return list_metadata('apps/v1', 'replicasets', ns)
 
 
 def fetch_pods(ns=None):
-    api = client.CoreV1Api()
-    return api.list_namespaced_pod(ns).items if ns else api.list_pod_for_all_namespaces().items
+    """
+    Stream the pod list and keep only metadata and container ports, without building swagger models.
+    """
+    resp = list_raw('v1', 'pods', ns)
+    try:
+        return [_pod(item) for item in ijson.items(resp, 'items.item')]
+    finally:
+        resp.release_conn()
 
 
 def fetch_services(ns=None):
-    api = client.CoreV1Api()
-    return api.list_namespaced_service(ns).items if ns else api.list_service_for_all_namespaces().items
+    return [_service(item) for item in list_items('v1', 'services', ns)]
 
 
 def fetch_ingresses(ns=None):
-    api = client.NetworkingV1Api()
-    return api.list_namespaced_ingress(ns).items if ns else api.list_ingress_for_all_namespaces().items
+    return [_ingress(item) for item in list_items('networking.k8s.io/v1', 'ingresses', ns)]
 
 
 def fetch_jobs(ns=None):
-    api = client.BatchV1Api()
-    return api.list_namespaced_job(ns).items if ns else api.list_job_for_all_namespaces().items
+    return list_metadata('batch/v1', 'jobs', ns)
 
 
 def fetch_cronjobs(ns=None):
-    api = client.BatchV1Api()
-    return api.list_namespaced_cron_job(ns).items if ns else api.list_cron_job_for_all_namespaces().items
+    return list_metadata('batch/v1', 'cronjobs', ns)
 
 
 # Add node functions
@@ -88,82 +222,136 @@ def add_nodes(dot, items, shape, color, prefix):
     """
     Generic: add nodes for k8s objects with given style.
     """
+    node = dot.node
+    debug = logger.isEnabledFor(logging.DEBUG)
     for obj in items:
-        nid = f"{prefix}-{obj.metadata.namespace}/{obj.metadata.name}"
-        dot.node(nid, label=f"{prefix}\n{obj.metadata.name}", shape=shape, style='filled', fillcolor=color)
-        logger.info("Added node %s - %s", prefix, nid)
+        md = obj.metadata
+        name = md.name
+        nid = f"{prefix}-{md.namespace}/{name}"
+        node(nid, label=f"{prefix}\n{name}", shape=shape, style='filled', fillcolor=color)
+        if debug:
+            logger.debug("Added node %s - %s", prefix, nid)
+    logger.info("Added %d %s nodes", len(items), prefix)
 
 
 # Link functions
 
-def link_owner_to_pods(dot, pods, owner_kind, label, prefix):
+def build_pod_index(pods):
     """
-    Link owner objects (ReplicaSet, StatefulSet, DaemonSet, Job) to their Pod children via ownerReferences.
+    Pair every pod with its node id once, so the link passes don't rebuild it.
     """
-    for pod in pods:
-        pod_id = f"{POD_PREFIX}-{pod.metadata.namespace}/{pod.metadata.name}"
-        for owner in pod.metadata.owner_references or []:
-            if owner.kind == owner_kind:
-                base = '-'.join(owner.name.split('-')[:-1])
-                owner_id = f"{prefix}-{pod.metadata.namespace}/{base}" if owner_kind != 'Job' else f"{prefix}-{pod.metadata.namespace}/{owner.name}"
-                dot.edge(owner_id, pod_id, label=label)
-                logger.info("linked owner to pod ownerd_id: %s pod_id: %s ",owner_id, pod_id)
+    return [(pod, f"{POD_PREFIX}-{pod.metadata.namespace}/{pod.metadata.name}") for pod in pods]
 
 
-def link_services_to_pods(dot, services, pods):
+def build_owner_index(rss, deps, sts, dss, jobs):
+    """
+    Map owner UIDs to (node id, edge label). ReplicaSets resolve to their owning Deployment node.
+    """
+    dep_ids = {d.metadata.uid: f"{DEPLOYMENT_PREFIX}-{d.metadata.namespace}/{d.metadata.name}" for d in deps}
+    owner_ids = {}
+    for rs in rss:
+        for owner in rs.metadata.owner_references:
+            dep_id = dep_ids.get(owner.uid) if owner.kind == DEPLOYMENT_PREFIX else None
+            if dep_id:
+                owner_ids[rs.metadata.uid] = (dep_id, REPLICA_LABEL)
+    for items, prefix, label in ((sts, STATEFUL_SET_PREFIX, REPLICA_LABEL), (dss, DAEMON_SET_PREFIX, DAEMON_LABEL),
+                                 (jobs, JOB_PREFIX, JOB_LABEL)):
+        for obj in items:
+            md = obj.metadata
+            owner_ids[md.uid] = (f"{prefix}-{md.namespace}/{md.name}", label)
+    return owner_ids
+
+
+def link_owner_to_pods(dot, pod_index, owner_ids):
+    """
+    Link owner objects (Deployment via ReplicaSet, StatefulSet, DaemonSet, Job) to their Pod children via
+    ownerReferences, resolved by owner UID.
+    """
+    edge = dot.edge
+    debug = logger.isEnabledFor(logging.DEBUG)
+    linked = 0
+    for pod, pod_id in pod_index:
+        for owner in pod.metadata.owner_references:
+            owner_link = owner_ids.get(owner.uid)
+            if owner_link:
+                owner_id, label = owner_link
+                edge(owner_id, pod_id, label=label)
+                linked += 1
+                if debug:
+                    logger.debug("linked owner to pod ownerd_id: %s pod_id: %s ",owner_id, pod_id)
+    logger.info("Linked %d pods to their owners", linked)
+
+
+def index_pods(pod_index):
+    """
+    Bucket pods by namespace, each bucket holding inverted indexes (label, value) -> (pod_id, label items)
+    and containerPort -> pod_id.
+    """
+    pods_by_ns = {}
+    for pod, pod_id in pod_index:
+        md = pod.metadata
+        ns_pods = pods_by_ns.get(md.namespace)
+        if ns_pods is None:
+            ns_pods = pods_by_ns[md.namespace] = NamespacePods(defaultdict(list), defaultdict(list))
+        entry = (pod_id, frozenset(md.labels.items()))
+        for kv in entry[1]:
+            ns_pods.by_label[kv].append(entry)
+        for port in pod.container_ports:
+            ns_pods.by_port[port].append(pod_id)
+    return pods_by_ns
+
+
+def link_services_to_pods(dot, services, pods_by_ns):
     """
     Link Service nodes to Pod nodes.
     - If Service has a selector, match pods by labels.
-    - Otherwise, match pods exposing the same targetPort on any container.
+    - Otherwise, or when the selector matches no pod, match pods exposing the same targetPort on any container.
     """
-    svc_linked = []
+    edge = dot.edge
+    debug = logger.isEnabledFor(logging.DEBUG)
+    linked = 0
 
     for svc in services:
-        svc_id = f"{SERVICE_PREFIX}-{svc.metadata.namespace}/{svc.metadata.name}"
-        selector = svc.spec.selector or {}
-        # Gather possible ports sp.targetPort values
-        for pod in pods:
-            if pod.metadata.namespace != svc.metadata.namespace:
-                continue
-            labels = pod.metadata.labels or {}
-            # Try matching by selector
-            if selector and all(labels.get(k) == v for k, v in selector.items()):
-                pod_id = f"{POD_PREFIX}-{pod.metadata.namespace}/{pod.metadata.name}"
-                dot.edge(svc_id, pod_id, label='svc')
-                logger.info("linked service to pod svc_id: %s pod_id: %s ",svc_id, pod_id)
-                svc_linked.append(svc)
-
-    for svc in services:
-
-        if svc in svc_linked:
+        md = svc.metadata
+        ns_pods = pods_by_ns.get(md.namespace)
+        if ns_pods is None:
             continue
-
-        svc_id = f"{SERVICE_PREFIX}-{svc.metadata.namespace}/{svc.metadata.name}"
-        # Gather possible ports sp.targetPort values
-        ports = [p.target_port for p in svc.spec.ports]
-        for pod in pods:
-            if pod.metadata.namespace != svc.metadata.namespace:
-                continue
-            # Fallback: match by containerPort
-            for container in pod.spec.containers:
-                for p in container.ports or []:
-                    if p.container_port in ports:
-                        pod_id = f"{POD_PREFIX}-{pod.metadata.namespace}/{pod.metadata.name}"
-                        dot.edge(svc_id, pod_id, label='svc')
-                        logger.info("linked service to pod svc_id: %s pod_id: %s ",svc_id, pod_id)
+        pod_ids = []
+        selector = svc.selector
+        if selector:
+            # Only pods carrying the rarest selector pair can match; verify the remaining pairs on those
+            sel_items = frozenset(selector.items())
+            candidates = min((ns_pods.by_label.get(kv, ()) for kv in sel_items), key=len)
+            pod_ids = [pod_id for pod_id, pod_items in candidates if sel_items <= pod_items]
+        if not pod_ids:
+            # Fallback: match by containerPort against the service's targetPort values; a pod exposing
+            # several of the target ports still gets a single edge
+            by_port = ns_pods.by_port
+            pod_ids = dict.fromkeys(pod_id for port in set(svc.target_ports) for pod_id in by_port.get(port, ()))
+
+        svc_id = f"{SERVICE_PREFIX}-{md.namespace}/{md.name}"
+        for pod_id in pod_ids:
+            edge(svc_id, pod_id, label='svc')
+            linked += 1
+            if debug:
+                logger.debug("linked service to pod svc_id: %s pod_id: %s ",svc_id, pod_id)
+    logger.info("Linked %d service to pod edges", linked)
 
 
 def link_ingresses_to_services(dot, ingresses):
     """
     Link Ingress objects to Services based on HTTP paths.
     """
-    for ing in ingresses:
-        ing_id = f"{INGRESS_PREFIX}-{ing.metadata.namespace}/{ing.metadata.name}"
-        for rule in ing.spec.rules or []:
-            for path in rule.http.paths:
-                svc_id = f"{SERVICE_PREFIX}-{ing.metadata.namespace}/{path.backend.service.name}"
-                dot.edge(ing_id, svc_id, label=path.path)
-                logger.info("linked ingress to service ing_id: %s svc_id: %s ",ing_id, svc_id)
+    edges = [(f"{INGRESS_PREFIX}-{ing.metadata.namespace}/{ing.metadata.name}",
+              f"{SERVICE_PREFIX}-{ing.metadata.namespace}/{svc_name}", path)
+             for ing in ingresses for svc_name, path in ing.paths]
+    edge = dot.edge
+    for ing_id, svc_id, path in edges:
+        edge(ing_id, svc_id, label=path)
+    if logger.isEnabledFor(logging.DEBUG):
+        for ing_id, svc_id, _ in edges:
+            logger.debug("linked ingress to service ing_id: %s svc_id: %s ",ing_id, svc_id)
+    logger.info("Linked %d ingress to service edges", len(edges))
 
 
 def link_cronjobs_to_jobs(dot, jobs, cronjobs):
@@ -171,34 +359,49 @@ def link_cronjobs_to_jobs(dot, jobs, cronjobs):
     Link CronJob objects to their Job children via ownerReferences.
     """
     cron_ids = {cj.metadata.uid: f"{CRON_JOB_PREFIX}-{cj.metadata.namespace}/{cj.metadata.name}" for cj in cronjobs}
+    edge = dot.edge
+    debug = logger.isEnabledFor(logging.DEBUG)
+    linked = 0
     for job in jobs:
-        job_id = f"{JOB_PREFIX}-{job.metadata.namespace}/{job.metadata.name}"
-        for owner in job.metadata.owner_references or []:
-            if owner.kind == 'CronJob' and owner.uid in cron_ids:
-                dot.edge(cron_ids[owner.uid], job_id, label='schedule')
-                logger.info("linked cronjob to job cron_id: %s job_id: %s ",cron_ids[owner.uid], job_id)
+        md = job.metadata
+        job_id = f"{JOB_PREFIX}-{md.namespace}/{md.name}"
+        for owner in md.owner_references:
+            cron_id = cron_ids.get(owner.uid) if owner.kind == 'CronJob' else None
+            if cron_id:
+                edge(cron_id, job_id, label='schedule')
+                linked += 1
+                if debug:
+                    logger.debug("linked cronjob to job cron_id: %s job_id: %s ",cron_id, job_id)
+    logger.info("Linked %d jobs to their cronjobs", linked)
 
 
 # Main execution
 
 def fetch_resources(ns):
-    deps = fetch_deployments(ns)
-    sts = fetch_statefulsets(ns)
-    dss = fetch_daemonsets(ns)
-    pods = fetch_pods(ns)
-    svcs = fetch_services(ns)
-    ings = fetch_ingresses(ns)
-    jobs = fetch_jobs(ns)
-    cronjobs = fetch_cronjobs(ns)
-    return cronjobs, deps, dss, ings, jobs, pods, sts, svcs
-
-
-def create_links(cronjobs, dot, ings, jobs, pods, svcs):
-    link_owner_to_pods(dot, pods, REPLICA_SET_PREFIX, REPLICA_LABEL, DEPLOYMENT_PREFIX)
-    link_owner_to_pods(dot, pods, STATEFUL_SET_PREFIX, REPLICA_LABEL, STATEFUL_SET_PREFIX)
-    link_owner_to_pods(dot, pods, DAEMON_SET_PREFIX, DAEMON_LABEL, DAEMON_SET_PREFIX)
-    link_owner_to_pods(dot, pods, JOB_PREFIX, JOB_LABEL, JOB_PREFIX)
-    link_services_to_pods(dot, svcs, pods)
+    """
+    Fetch all resource kinds concurrently; the list calls are independent round-trips to the apiserver.
+    """
+    fetchers = {
+        'deps': fetch_deployments,
+        'sts': fetch_statefulsets,
+        'dss': fetch_daemonsets,
+        'pods': fetch_pods,
+        'rss': fetch_replicasets,
+        'svcs': fetch_services,
+        'ings': fetch_ingresses,
+        'jobs': fetch_jobs,
+        'cronjobs': fetch_cronjobs,
+    }
+    with ThreadPoolExecutor(max_workers=len(fetchers)) as ex:
+        futures = {name: ex.submit(fn, ns) for name, fn in fetchers.items()}
+        res = {name: future.result() for name, future in futures.items()}
+    return (res['cronjobs'], res['deps'], res['dss'], res['ings'], res['jobs'], res['pods'], res['rss'],
+            res['sts'], res['svcs'])
+
+
+def create_links(cronjobs, dot, ings, jobs, owner_ids, pod_index, pods_by_ns, svcs):
+    link_owner_to_pods(dot, pod_index, owner_ids)
+    link_services_to_pods(dot, svcs, pods_by_ns)
     link_ingresses_to_services(dot, ings)
     link_cronjobs_to_jobs(dot, jobs, cronjobs)
 
@@ -222,12 +425,18 @@ def parse_args():
 
 
 def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='[%(asctime)s.%(msecs)03d] [%(levelname)s] %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S',
+        force=True
+    )
     args = parse_args()
     load_kube_config()
     ns = args.namespace
 
     # Fetch resources
-    cronjobs, deps, dss, ings, jobs, pods, sts, svcs = fetch_resources(ns)
+    cronjobs, deps, dss, ings, jobs, pods, rss, sts, svcs = fetch_resources(ns)
 
     # Build graph
     dot = create_graph()
@@ -236,10 +445,13 @@ def main():
     add_nodess(cronjobs, deps, dot, dss, ings, jobs, pods, sts, svcs)
 
     # Create links
-    create_links(cronjobs, dot, ings, jobs, pods, svcs)
+    pod_index = build_pod_index(pods)
+    owner_ids = build_owner_index(rss, deps, sts, dss, jobs)
+    pods_by_ns = index_pods(pod_index)
+    create_links(cronjobs, dot, ings, jobs, owner_ids, pod_index, pods_by_ns, svcs)
 
     # Render
-    out = dot.render(filename=args.output, cleanup=True)
+    out = dot.render(filename=args.output)
     logger.info(f"Graph generated: {out} (namespace: {ns or 'all'})")
 
 